@@ -6,7 +6,86 @@ Shor算法基础定义
 
 import math
 import random
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    # 未安装numba时，njit退化为不做任何处理的装饰器，被装饰的内核以普通Python函数运行，
+    # prange退化为range
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+    prange = range
+
+# ===== 数值精度 =====
+
+# 量子态振幅的默认数据类型
+DTYPE = np.complex128
+
+# precision参数与振幅数据类型的对应关系
+PRECISION_DTYPES = {
+    "single": np.complex64,
+    "double": np.complex128,
+}
+
+def state_tolerance(dtype) -> float:
+    """
+    返回给定振幅数据类型下归一化、振幅比较所用的容差
+    
+    参数:
+        dtype: 振幅数据类型
+        
+    返回:
+        float: complex64为1e-5，complex128为1e-10
+    """
+    return 1e-5 if np.dtype(dtype) == np.complex64 else 1e-10
+
+# ===== 随机采样 =====
+
+# 测量采样使用的随机数生成器
+_rng = np.random.default_rng()
+
+def set_random_seed(seed: int) -> None:
+    """
+    设置random模块和测量采样所用随机数生成器的种子
+    
+    参数:
+        seed: 随机种子
+    """
+    global _rng
+    random.seed(seed)
+    _rng = np.random.default_rng(seed)
+
+def sample_index(probabilities: np.ndarray) -> int:
+    """
+    按（未必归一化的）概率分布随机抽取一个索引
+    
+    使用累积和加二分查找，只遍历一次概率数组，且无需先归一化。
+    
+    参数:
+        probabilities: 非负概率（权重）数组
+        
+    返回:
+        int: 抽取到的索引
+        
+    异常:
+        ValueError: 如果权重之和不为正（全为0、为空或含NaN）
+    """
+    cdf = np.cumsum(probabilities)
+    if len(cdf) == 0 or not cdf[-1] > 0:
+        raise ValueError("概率之和必须大于0")
+    
+    u = _rng.random() * cdf[-1]
+    index = int(np.searchsorted(cdf, u, side='right'))
+    
+    # 舍入可能使u恰好等于cdf[-1]，此时searchsorted返回len(cdf)，取最后一个索引
+    return min(index, len(cdf) - 1)
 
 # ===== 量子计算基础 =====
 
@@ -17,6 +96,7 @@ class Qubit:
     量子比特类定义
     
     属性:
+        vec: 量子态向量 [alpha, beta]，complex128数组
         alpha: |0⟩态的复数振幅
         beta: |1⟩态的复数振幅
     """
@@ -28,14 +108,37 @@ class Qubit:
             alpha: |0⟩态的振幅，默认为1
             beta: |1⟩态的振幅，默认为0
         """
+        self.vec = np.array([alpha, beta], dtype=np.complex128)
+        
         # 归一化处理
-        norm = math.sqrt(abs(alpha)**2 + abs(beta)**2)
+        norm = np.linalg.norm(self.vec)
         if norm > 0:
-            self.alpha = alpha / norm
-            self.beta = beta / norm
+            self.vec /= norm
         else:
-            self.alpha = 1+0j
-            self.beta = 0+0j
+            self.vec[:] = (1, 0)
+    
+    @classmethod
+    def from_vec(cls, vec: np.ndarray) -> 'Qubit':
+        """
+        由长度为2的振幅向量创建量子比特
+        
+        参数:
+            vec: 振幅向量 [alpha, beta]
+            
+        返回:
+            Qubit: 归一化后的量子比特
+        """
+        return cls(vec[0], vec[1])
+    
+    @property
+    def alpha(self) -> complex:
+        """|0⟩态的振幅"""
+        return self.vec[0]
+    
+    @property
+    def beta(self) -> complex:
+        """|1⟩态的振幅"""
+        return self.vec[1]
     
     def measure(self) -> int:
         """
@@ -59,18 +162,47 @@ class QuantumRegister:
     
     属性:
         num_qubits: 量子比特数
-        state: 量子态向量，长度为2^num_qubits
+        state: 量子态向量，长度为2^num_qubits的复数数组（默认complex128）
+        support: 可能非零的基态索引（升序int64数组），未知时为None；
+            已知时按索引计算的函数只需遍历这些分量
     """
-    def __init__(self, num_qubits: int):
+    def __init__(self, num_qubits: int, dtype=DTYPE):
         """
         初始化量子寄存器
         
         参数:
             num_qubits: 量子比特数
+            dtype: 振幅数据类型，np.complex128（默认）或np.complex64
         """
         self.num_qubits = num_qubits
-        self.state = [0j] * (2**num_qubits)
-        self.state[0] = 1+0j  # 初始化为|0⟩⊗n
+        self.state = np.zeros(1 << num_qubits, dtype=dtype)
+        self.state[0] = 1  # 初始化为|0⟩⊗n
+        self.support: Optional[np.ndarray] = None
+    
+    @classmethod
+    def from_array(cls, state_array: np.ndarray) -> 'QuantumRegister':
+        """
+        由已归一化的状态向量直接创建量子寄存器，不做复制和归一化
+        
+        参数:
+            state_array: 长度为2的幂、已归一化的复数数组
+            
+        返回:
+            QuantumRegister: 以该数组为状态向量的量子寄存器
+            
+        异常:
+            ValueError: 如果数组不是一维的或长度不是2的幂
+        """
+        size = state_array.size
+        if state_array.ndim != 1 or size == 0 or size & (size - 1) != 0:
+            raise ValueError(f"状态向量必须是长度为2的幂的一维数组，实际形状为{state_array.shape}")
+        
+        # 不调用__init__，避免先分配再丢弃一个同样大小的|0⟩状态向量
+        register = cls.__new__(cls)
+        register.num_qubits = state_array.size.bit_length() - 1
+        register.state = state_array
+        register.support = None
+        return register
     
     def set_state(self, state_vector: List[complex]) -> None:
         """
@@ -79,16 +211,27 @@ class QuantumRegister:
         参数:
             state_vector: 新的量子态向量
         """
-        if len(state_vector) != len(self.state):
+        state_array = np.asarray(state_vector, dtype=self.state.dtype)
+        if state_array.shape != self.state.shape:
             raise ValueError("状态向量长度不匹配")
         
         # 归一化
-        norm = math.sqrt(sum(abs(x)**2 for x in state_vector))
+        norm = np.linalg.norm(state_array)
         if norm > 0:
-            self.state = [x / norm for x in state_vector]
+            self.state = state_array / norm
+            self.support = None
         else:
             raise ValueError("不能设置全零状态")
     
+    def probabilities(self) -> np.ndarray:
+        """
+        计算每个基态的测量概率|α_i|²
+        
+        返回:
+            np.ndarray: 长度为2^num_qubits的实数数组
+        """
+        return (self.state.conj() * self.state).real
+    
     def measure(self) -> int:
         """
         测量量子寄存器，返回一个整数
@@ -96,8 +239,71 @@ class QuantumRegister:
         返回:
             int: 测量结果，范围0到2^num_qubits-1
         """
-        probabilities = [abs(x)**2 for x in self.state]
-        return random.choices(range(len(self.state)), weights=probabilities)[0]
+        return sample_index(self.probabilities())
+    
+    def nonzero_indices(self, threshold: float = 1e-10) -> np.ndarray:
+        """
+        返回振幅模大于threshold的基态索引
+        
+        support已知时只检查support中的分量，否则扫描整个状态向量。
+        
+        参数:
+            threshold: 振幅模的阈值
+            
+        返回:
+            np.ndarray: 升序的int64索引数组
+        """
+        if self.support is None:
+            return np.flatnonzero(np.abs(self.state) > threshold)
+        return self.support[np.abs(self.state[self.support]) > threshold]
+    
+    def nonzero_summary(self, limit: int = 5, threshold: float = 1e-10,
+                        chunk_size: int = 4096) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        统计振幅模大于threshold的分量个数，并返回最前和最后limit个这样的基态索引
+        
+        support已知时直接使用 nonzero_indices；否则个数用 np.count_nonzero 统计，
+        首尾索引分别从两端按块扫描，找到limit个后即停止，不构造完整的非零索引数组。
+        
+        参数:
+            limit: 首尾各返回的索引个数
+            threshold: 振幅模的阈值
+            chunk_size: 从两端扫描时每块的长度
+            
+        返回:
+            Tuple[int, np.ndarray, np.ndarray]: (非零分量个数, 最前limit个索引, 最后limit个索引)，索引均升序
+        """
+        if self.support is not None:
+            indices = self.nonzero_indices(threshold)
+            return len(indices), indices[:limit], indices[-limit:]
+        
+        count = int(np.count_nonzero(np.abs(self.state) > threshold))
+        size = len(self.state)
+        
+        # 从前往后扫描
+        first = []
+        found = 0
+        for start in range(0, size, chunk_size):
+            block = np.flatnonzero(np.abs(self.state[start:start + chunk_size]) > threshold) + start
+            first.append(block[:limit - found])
+            found += len(first[-1])
+            if found >= limit:
+                break
+        
+        # 从后往前扫描
+        last = []
+        found = 0
+        for stop in range(size, 0, -chunk_size):
+            start = max(0, stop - chunk_size)
+            block = np.flatnonzero(np.abs(self.state[start:stop]) > threshold) + start
+            last.append(block[max(0, len(block) - (limit - found)):])
+            found += len(last[-1])
+            if found >= limit:
+                break
+        
+        first_indices = np.concatenate(first) if first else np.empty(0, dtype=np.int64)
+        last_indices = np.concatenate(last[::-1]) if last else np.empty(0, dtype=np.int64)
+        return count, first_indices, last_indices
     
     def get_amplitude(self, index: int) -> complex:
         """
@@ -119,6 +325,63 @@ class QuantumRegister:
         else:
             return f"量子寄存器({self.num_qubits}量子比特, {len(non_zero)}个非零分量)"
 
+class SparseQuantumRegister:
+    """
+    稀疏量子寄存器类定义
+    
+    只保存非零振幅，适用于QFT混合第一寄存器之前的中间态：叠加态和模幂运算后的
+    量子态在2^(m+n)个基态中只有2^m个非零分量。
+    
+    属性:
+        num_qubits: 量子比特数
+        indices: 非零分量的基态索引（int64数组）
+        amplitudes: 对应的振幅（复数数组，与indices等长）
+    """
+    def __init__(self, num_qubits: int, indices: np.ndarray, amplitudes: np.ndarray):
+        """
+        初始化稀疏量子寄存器
+        
+        参数:
+            num_qubits: 量子比特数
+            indices: 非零分量的基态索引，互不相同
+            amplitudes: 对应的振幅，调用方保证已归一化
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        amplitudes = np.asarray(amplitudes)
+        if indices.shape != amplitudes.shape:
+            raise ValueError("索引与振幅长度不匹配")
+        
+        self.num_qubits = num_qubits
+        self.indices = indices
+        self.amplitudes = amplitudes
+    
+    def probabilities(self) -> np.ndarray:
+        """
+        计算每个非零分量的测量概率|α_i|²
+        
+        返回:
+            np.ndarray: 与indices等长的实数数组
+        """
+        return (self.amplitudes.conj() * self.amplitudes).real
+    
+    def to_dense(self) -> QuantumRegister:
+        """
+        转换为稠密的量子寄存器
+        
+        返回:
+            QuantumRegister: 状态向量长度为2^num_qubits的量子寄存器，support为非零分量的索引
+        """
+        state = np.zeros(1 << self.num_qubits, dtype=self.amplitudes.dtype)
+        state[self.indices] = self.amplitudes
+        
+        register = QuantumRegister.from_array(state)
+        register.support = np.sort(self.indices)
+        return register
+    
+    def __str__(self) -> str:
+        """返回稀疏量子寄存器的字符串表示"""
+        return f"稀疏量子寄存器({self.num_qubits}量子比特, {len(self.indices)}个非零分量)"
+
 # ===== 量子门定义 =====
 
 class QuantumGate:
@@ -132,7 +395,8 @@ class QuantumGate:
         num_qubits: 量子门作用的量子比特数
         name: 量子门的名称
     """
-    def __init__(self, matrix: List[List[complex]], num_qubits: int, name: str = "Unknown"):
+    def __init__(self, matrix: List[List[complex]], num_qubits: int, name: str = "Unknown",
+                 check_unitary: bool = True, dtype=DTYPE):
         """
         初始化量子门
         
@@ -140,18 +404,20 @@ class QuantumGate:
             matrix: 量子门的酉矩阵表示
             num_qubits: 量子门作用的量子比特数
             name: 量子门的名称
+            check_unitary: 是否验证矩阵的酉性；由工厂函数构造、酉性已有保证的门可传入False
+            dtype: 矩阵元素数据类型，np.complex128（默认）或np.complex64，应与所作用寄存器的数据类型一致
         """
-        self.matrix = matrix
+        self.matrix = np.asarray(matrix, dtype=dtype)
         self.num_qubits = num_qubits
         self.name = name
         
         # 验证矩阵维度
         expected_size = 2 ** num_qubits
-        if len(matrix) != expected_size or any(len(row) != expected_size for row in matrix):
+        if self.matrix.shape != (expected_size, expected_size):
             raise ValueError(f"矩阵维度不匹配，期望{expected_size}×{expected_size}")
         
         # 验证酉性 (U†U = I)
-        if not self._is_unitary():
+        if check_unitary and not self._is_unitary():
             raise ValueError("矩阵不是酉矩阵")
     
     def _is_unitary(self) -> bool:
@@ -161,30 +427,9 @@ class QuantumGate:
         返回:
             bool: 如果是酉矩阵返回True，否则返回False
         """
-        # 计算U†U
-        n = len(self.matrix)
-        identity = [[0j] * n for _ in range(n)]
-        
-        # 计算共轭转置 U†
-        conjugate_transpose = [[complex(0, 0) for _ in range(n)] for _ in range(n)]
-        for i in range(n):
-            for j in range(n):
-                conjugate_transpose[i][j] = complex(self.matrix[j][i].real, -self.matrix[j][i].imag)
-        
-        # 计算 U†U
-        for i in range(n):
-            for j in range(n):
-                for k in range(n):
-                    identity[i][j] += conjugate_transpose[i][k] * self.matrix[k][j]
-        
-        # 检查是否为单位矩阵
-        for i in range(n):
-            for j in range(n):
-                expected = 1.0 if i == j else 0.0
-                if abs(identity[i][j].real - expected) > 1e-10 or abs(identity[i][j].imag) > 1e-10:
-                    return False
-        
-        return True
+        # 计算 U†U 并与单位矩阵比较，容差随矩阵精度确定
+        product = self.matrix.conj().T @ self.matrix
+        return np.allclose(product, np.eye(len(self.matrix)), rtol=0, atol=state_tolerance(self.matrix.dtype))
     
     def apply_to_qubit(self, qubit: 'Qubit') -> 'Qubit':
         """
@@ -200,10 +445,7 @@ class QuantumGate:
             raise ValueError(f"此量子门作用于{self.num_qubits}个量子比特，不能应用于单个量子比特")
         
         # 应用矩阵变换
-        new_alpha = self.matrix[0][0] * qubit.alpha + self.matrix[0][1] * qubit.beta
-        new_beta = self.matrix[1][0] * qubit.alpha + self.matrix[1][1] * qubit.beta
-        
-        return Qubit(new_alpha, new_beta)
+        return Qubit.from_vec(self.matrix @ qubit.vec)
     
     def apply_to_register(self, register: 'QuantumRegister', target_qubits: List[int]) -> 'QuantumRegister':
         """
@@ -220,42 +462,59 @@ class QuantumGate:
             raise ValueError(f"量子门作用量子比特数({self.num_qubits})与目标量子比特数({len(target_qubits)})不匹配")
         
         n = register.num_qubits
-        new_state = [0j] * len(register.state)
-        
-        # 对每个基态应用量子门
-        for i in range(len(register.state)):
-            # 获取当前基态的振幅
-            amplitude = register.state[i]
-            if abs(amplitude) < 1e-10:
-                continue
-            
-            # 确定目标量子比特的状态
-            target_state = 0
-            for idx, qubit_idx in enumerate(target_qubits):
-                if (i >> (n - 1 - qubit_idx)) & 1:
-                    target_state |= (1 << (self.num_qubits - 1 - idx))
-            
-            # 对目标量子比特的所有可能状态应用量子门
-            for j in range(2 ** self.num_qubits):
-                # 计算矩阵元素
-                matrix_element = self.matrix[j][target_state]
-                
-                # 构建新的基态索引
-                new_index = i
-                for idx, qubit_idx in enumerate(target_qubits):
-                    # 清除原目标量子比特的值
-                    new_index &= ~(1 << (n - 1 - qubit_idx))
-                    # 设置新的值
-                    if (j >> (self.num_qubits - 1 - idx)) & 1:
-                        new_index |= (1 << (n - 1 - qubit_idx))
-                
-                # 添加振幅贡献
-                new_state[new_index] += matrix_element * amplitude
-        
-        # 创建新的量子寄存器
-        new_register = QuantumRegister(n)
-        new_register.set_state(new_state)
-        return new_register
+        k = self.num_qubits
+        
+        # 将状态向量视为 (2, 2, ..., 2) 张量，第i个轴对应第i个量子比特
+        tensor = register.state.reshape((2,) * n)
+        
+        # 把目标量子比特移到最前面，展平为 2^k × 2^(n-k) 矩阵后左乘量子门矩阵
+        tensor = np.moveaxis(tensor, target_qubits, range(k))
+        moved_shape = tensor.shape
+        new_tensor = (self.matrix @ tensor.reshape(1 << k, -1)).reshape(moved_shape)
+        
+        # 恢复量子比特的原始顺序
+        new_state = np.moveaxis(new_tensor, range(k), target_qubits).reshape(-1)
+        
+        # 酉变换保持归一化，新数组直接作为状态向量，不再经过set_state的复制和归一化
+        return QuantumRegister.from_array(new_state.astype(register.state.dtype, copy=False))
+    
+    def apply_inplace(self, state: np.ndarray, target_qubits: List[int]) -> None:
+        """
+        原地对状态向量的指定量子比特应用量子门，不创建新的量子寄存器
+        
+        对角门（如受控相位门）只修改对角元不为1的分量；单量子比特门直接组合|0⟩和|1⟩两半；
+        其他情况退化为与 apply_to_register 相同的矩阵乘法，结果写回原数组。
+        
+        参数:
+            state: 长度为2^n的状态向量（原地修改）
+            target_qubits: 目标量子比特的索引列表
+        """
+        if len(target_qubits) != self.num_qubits:
+            raise ValueError(f"量子门作用量子比特数({self.num_qubits})与目标量子比特数({len(target_qubits)})不匹配")
+        
+        n = state.size.bit_length() - 1
+        k = self.num_qubits
+        
+        # 目标量子比特移到最前面的视图，对它的修改直接写回state
+        tensor = np.moveaxis(state.reshape((2,) * n), target_qubits, range(k))
+        
+        diagonal = np.diag(self.matrix)
+        if np.count_nonzero(self.matrix - np.diag(diagonal)) == 0:
+            # 1. 对角门：只有对角元不为1的基态分量需要乘以相位
+            for basis in np.flatnonzero(diagonal != 1):
+                bits = tuple((int(basis) >> (k - 1 - i)) & 1 for i in range(k))
+                tensor[bits] *= diagonal[basis]
+        elif k == 1:
+            # 2. 单量子比特门：|0⟩分量和|1⟩分量按矩阵元线性组合
+            (u00, u01), (u10, u11) = self.matrix
+            amp0 = tensor[0].copy()
+            tensor[0] *= u00
+            tensor[0] += u01 * tensor[1]
+            tensor[1] *= u11
+            tensor[1] += u10 * amp0
+        else:
+            # 3. 一般情况：展平为 2^k × 2^(n-k) 矩阵后左乘量子门矩阵
+            tensor[...] = (self.matrix @ tensor.reshape(1 << k, -1)).reshape(tensor.shape)
     
     def __str__(self) -> str:
         """返回量子门的字符串表示"""
@@ -263,13 +522,16 @@ class QuantumGate:
 
 # 常用量子门定义
 
-def create_hadamard_gate() -> QuantumGate:
+def create_hadamard_gate(dtype=DTYPE) -> QuantumGate:
     """
     创建Hadamard门
     
     H = 1/√2 * [[1, 1],
                 [1, -1]]
     
+    参数:
+        dtype: 矩阵元素数据类型，np.complex128（默认）或np.complex64
+    
     返回:
         QuantumGate: Hadamard门对象
     """
@@ -278,4 +540,4 @@ def create_hadamard_gate() -> QuantumGate:
         [inv_sqrt2, inv_sqrt2],
         [inv_sqrt2, -inv_sqrt2]
     ]
-    return QuantumGate(matrix, 1, "Hadamard")
\ No newline at end of file
+    return QuantumGate(matrix, 1, "Hadamard", check_unitary=False, dtype=dtype)
\ No newline at end of file
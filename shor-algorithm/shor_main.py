@@ -5,16 +5,17 @@ Shor算法主文件
 包含所有7个步骤的核心实现。
 """
 
+import argparse
 import math
-import random
 from typing import Dict, Tuple, Optional
-from shor_step1 import initialize_quantum_state
-from shor_step2 import apply_hadamard_to_first_register
-from shor_step3 import apply_modular_exponentiation
-from shor_step4 import measure_second_register
-from shor_step5 import quantum_fourier_transform
-from shor_step6 import measure_first_register
-from shor_step7 import classical_post_processing
+from shor_definitions import PRECISION_DTYPES, set_random_seed
+from shor_step2 import create_sparse_superposition, verify_superposition
+from shor_step3 import (apply_modular_exponentiation_sparse, clear_modular_exponentiation_cache,
+                         verify_modular_exponentiation)
+from shor_step4 import measure_second_register_sparse
+from shor_step5 import quantum_fourier_transform_1d
+from shor_step6 import measure_first_register_1d
+from shor_step7 import classical_post_processing, clear_post_processing_cache
 
 def calculate_qubits_needed(N: int) -> Dict[str, int]:
     """
@@ -38,18 +39,37 @@ def calculate_qubits_needed(N: int) -> Dict[str, int]:
         "total": total_qubits    # 总量子比特数
     }
 
-def shor_algorithm(N: int, max_attempts: int = 5) -> Optional[Tuple[int, int]]:
+def shor_algorithm(N: int, max_attempts: int = 5, verbose: bool = False,
+                   precision: str = "double", validate: bool = False) -> Optional[Tuple[int, int]]:
     """
     完整的Shor算法实现
     
     参数:
         N: 要分解的合数
         max_attempts: 最大尝试次数
+        verbose: 是否打印每个基数、每次尝试的逐步执行信息
+        precision: 量子态振幅精度，"double"（complex128，默认）或"single"（complex64）
+        validate: 为True时在步骤2和步骤3之后验证量子态（需要构造稠密状态向量）
         
     返回:
         (p, q) N的因子，如果无法分解则返回None
+        
+    异常:
+        ValueError: 如果precision不是"single"或"double"
+        RuntimeError: 如果validate为True且量子态验证失败
     """
-    print(f"=== 开始执行Shor算法分解 N = {N} ===")
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(f"precision必须是'single'或'double'，得到: {precision}")
+    dtype = PRECISION_DTYPES[precision]
+    
+    # 模幂运算和后处理的缓存只对同一个N有效
+    clear_modular_exponentiation_cache()
+    clear_post_processing_cache()
+    
+    # 非详细模式下不输出逐步信息
+    log = print if verbose else (lambda *args, **kwargs: None)
+    
+    log(f"=== 开始执行Shor算法分解 N = {N} ===")
     
     # 检查N是否为合数
     if N <= 1 or N % 2 == 0:
@@ -66,7 +86,7 @@ def shor_algorithm(N: int, max_attempts: int = 5) -> Optional[Tuple[int, int]]:
             #     return (gcd_val, N // gcd_val)
             continue
         
-        print(f"\n使用基数 a = {a}")
+        log(f"\n使用基数 a = {a}")
         
         # 计算所需量子比特数
         qubit_info = calculate_qubits_needed(N)
@@ -74,61 +94,70 @@ def shor_algorithm(N: int, max_attempts: int = 5) -> Optional[Tuple[int, int]]:
         n = qubit_info["n"]
         Q = 2**m
         
-        print(f"量子比特需求: m = {m}, n = {n}, Q = {Q}")
+        log(f"量子比特需求: m = {m}, n = {n}, Q = {Q}")
         
         # 尝试多次运行量子部分
         for attempt in range(1, max_attempts + 1):
-            print(f"\n--- 尝试 {attempt}/{max_attempts} ---")
+            log(f"\n--- 尝试 {attempt}/{max_attempts} ---")
             
-            # 步骤1：量子态初始化
-            print("步骤1：初始化量子态 |0⟩⊗m |0⟩⊗n")
-            initial_state = initialize_quantum_state(m, n)
+            # 步骤1-3的量子态在2^(m+n)个基态中只有2^m个非零分量，使用稀疏表示，
+            # 初始态|0⟩⊗m |0⟩⊗n 不显式构造，直接写出对它应用Hadamard门后的叠加态
+            log("步骤1：初始态 |0⟩⊗m |0⟩⊗n（稀疏表示下隐式给出，不单独构造）")
             
             # 步骤2：叠加态创建
-            print("步骤2：创建叠加态 (1/√Q) ∑|x⟩|0⟩")
-            superposition_state = apply_hadamard_to_first_register(initial_state, m, n)
+            log("步骤2：创建叠加态 (1/√Q) ∑|x⟩|0⟩")
+            superposition_state = create_sparse_superposition(m, n, dtype=dtype)
+            if validate and not verify_superposition(superposition_state.to_dense(), m, n):
+                raise RuntimeError("叠加态创建失败")
             
             # 步骤3：量子模幂运算
-            print(f"步骤3：应用量子模幂运算 |x⟩|0⟩ → |x⟩|{a}^x mod {N}⟩")
-            modular_exponentiation_state = apply_modular_exponentiation(superposition_state, a, N, m, n)
+            log(f"步骤3：应用量子模幂运算 |x⟩|0⟩ → |x⟩|{a}^x mod {N}⟩")
+            modular_exponentiation_state = apply_modular_exponentiation_sparse(superposition_state, a, N, m, n)
+            if validate and not verify_modular_exponentiation(modular_exponentiation_state.to_dense(), a, N, m, n):
+                raise RuntimeError("模幂运算应用失败")
             
             # 步骤4：测量第二寄存器
-            print("步骤4：测量第二寄存器")
-            collapsed_state, measurement_result = measure_second_register(modular_exponentiation_state, m, n)
-            print(f"  测量结果: y₀ = {measurement_result}")
+            # 测量后第二寄存器固定为|y₀⟩，后续步骤只需处理第一寄存器的2^m个振幅
+            log("步骤4：测量第二寄存器")
+            first_register, measurement_result = measure_second_register_sparse(modular_exponentiation_state, m, n)
+            log(f"  测量结果: y₀ = {measurement_result}")
             
             # 步骤5：量子傅里叶变换
-            print("步骤5：应用量子傅里叶变换")
-            qft_state = quantum_fourier_transform(collapsed_state, m)
+            log("步骤5：应用量子傅里叶变换")
+            qft_amplitudes = quantum_fourier_transform_1d(first_register)
             
             # 步骤6：测量第一寄存器
-            print("步骤6：测量第一寄存器")
-            measurement_c, final_state = measure_first_register(qft_state, m, n)
-            print(f"  测量结果: c = {measurement_c}")
+            log("步骤6：测量第一寄存器")
+            measurement_c = measure_first_register_1d(qft_amplitudes)
+            log(f"  测量结果: c = {measurement_c}")
             
             # 步骤7：经典后处理
-            print("步骤7：经典后处理")
+            log("步骤7：经典后处理")
             factors = classical_post_processing(measurement_c, Q, N, a)
             
             if factors:
                 p, q = factors
-                print(f"  ✓ 成功分解 {N} = {p} × {q}")
-                print(f"=== 算法成功完成 ===")
+                log(f"  ✓ 成功分解 {N} = {p} × {q}")
+                log(f"=== 算法成功完成 ===")
                 return factors
             else:
-                print(f"  ✗ 尝试 {attempt} 未能分解 {N}")
+                log(f"  ✗ 尝试 {attempt} 未能分解 {N}")
         
-        print(f"基数 a = {a} 在 {max_attempts} 次尝试后未能分解 {N}")
+        log(f"基数 a = {a} 在 {max_attempts} 次尝试后未能分解 {N}")
     
-    print(f"=== 算法失败：无法分解 {N} ===")
+    log(f"=== 算法失败：无法分解 {N} ===")
     return None
 
-def main():
+def main(verbose: bool = False, validate: bool = False):
     """
     主函数，运行Shor算法
+    
+    参数:
+        verbose: 是否打印Shor算法每一步的执行信息
+        validate: 是否在各步骤之后验证量子态
     """
     # 设置随机种子以获得可重复的结果
-    random.seed(42)
+    set_random_seed(42)
     
     print("=" * 60)
     print("Shor算法实现")
@@ -146,7 +175,7 @@ def main():
     print(f"  总量子比特数: {qubit_info['total']}")
     
     # 执行算法
-    factors = shor_algorithm(N)
+    factors = shor_algorithm(N, verbose=verbose, validate=validate)
     
     if factors:
         p, q = factors
@@ -161,4 +190,8 @@ def main():
     print("=" * 60)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Shor算法演示")
+    parser.add_argument("--verbose", action="store_true", help="打印每次尝试的逐步执行信息")
+    parser.add_argument("--check", action="store_true", help="在各步骤之后验证量子态")
+    args = parser.parse_args()
+    main(verbose=args.verbose, validate=args.check)
\ No newline at end of file
@@ -5,16 +5,17 @@ Shor算法步骤1：量子态初始化
 初始时，所有量子比特都处于|0⟩状态：|ψ₀⟩ = |0⟩⊗m |0⟩⊗n
 """
 
-import math
-from shor_definitions import QuantumRegister
+import numpy as np
+from shor_definitions import QuantumRegister, DTYPE, state_tolerance
 
-def initialize_quantum_state(m: int, n: int) -> QuantumRegister:
+def initialize_quantum_state(m: int, n: int, dtype=DTYPE) -> QuantumRegister:
     """
     初始化量子态为|0⟩⊗m |0⟩⊗n
     
     参数:
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        dtype: 振幅数据类型，np.complex128（默认）或np.complex64
         
     返回:
         QuantumRegister: 初始化的量子寄存器
@@ -28,11 +29,10 @@ def initialize_quantum_state(m: int, n: int) -> QuantumRegister:
     
     # 创建总量子寄存器
     total_qubits = m + n
-    quantum_register = QuantumRegister(total_qubits)
+    quantum_register = QuantumRegister(total_qubits, dtype=dtype)
     
-    # 验证初始状态
+    # QuantumRegister构造时已初始化为|0⟩⊗(m+n)，此处只做O(1)的检查，完整验证见 verify_initialization
     assert abs(quantum_register.state[0] - 1.0) < 1e-10, "初始状态不正确"
-    assert all(abs(quantum_register.state[i]) < 1e-10 for i in range(1, len(quantum_register.state))), "初始状态不正确"
     
     return quantum_register
 
@@ -55,13 +55,13 @@ def verify_initialization(state: QuantumRegister, m: int, n: int) -> bool:
         return False
     
     # 检查归一化
-    norm = math.sqrt(sum(abs(x)**2 for x in state.state))
-    if not abs(norm - 1.0) < 1e-10:
+    norm = np.linalg.norm(state.state)
+    if not abs(norm - 1.0) < state_tolerance(state.state.dtype):
         print(f"错误：量子态未归一化，范数为{norm}")
         return False
     
     # 检查是否只有第一个元素非零
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
+    non_zero_indices = np.flatnonzero(np.abs(state.state) > 1e-10).tolist()
     if len(non_zero_indices) != 1 or non_zero_indices[0] != 0:
         print(f"错误：应有且仅有|0⟩状态非零，实际非零索引为{non_zero_indices}")
         return False
@@ -81,11 +81,11 @@ def print_quantum_state_info(state: QuantumRegister, m: int, n: int) -> None:
     print(f"第一寄存器位数 (m): {m}")
     print(f"第二寄存器位数 (n): {n}")
     print(f"总量子比特数: {m + n}")
-    norm = math.sqrt(sum(abs(x)**2 for x in state.state))
+    norm = np.linalg.norm(state.state)
     print(f"量子态归一化检查: {norm:.6f} (应为1.0)")
     
     # 显示前几个非零元素（初始化后只有第一个元素非零）
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
+    non_zero_indices = np.flatnonzero(np.abs(state.state) > 1e-10).tolist()
     print(f"非零元素索引: {non_zero_indices}")
     print(f"非零元素值: {[state.state[i] for i in non_zero_indices]}")
 
@@ -6,10 +6,12 @@ Shor算法步骤2：叠加态创建
 """
 
 import math
-from shor_definitions import QuantumRegister, create_hadamard_gate
+import numpy as np
+from shor_definitions import DTYPE, QuantumRegister, SparseQuantumRegister, state_tolerance
 from shor_step1 import initialize_quantum_state, verify_initialization
 
-def apply_hadamard_to_first_register(state: QuantumRegister, m: int, n: int) -> QuantumRegister:
+def apply_hadamard_to_first_register(state: QuantumRegister, m: int, n: int,
+                                     validate: bool = False) -> QuantumRegister:
     """
     对第一寄存器应用Hadamard门，创建均匀叠加态
     
@@ -17,27 +19,56 @@ def apply_hadamard_to_first_register(state: QuantumRegister, m: int, n: int) ->
         state: 当前量子态
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        validate: 为True时对输入状态做完整的初始化验证
         
     返回:
         QuantumRegister: 应用Hadamard门后的量子态
+        
+    异常:
+        ValueError: 如果输入状态不是|0⟩⊗m |0⟩⊗n
     """
     # 输入验证
     if state.num_qubits != m + n:
         raise ValueError(f"量子寄存器大小不匹配，期望{m+n}，实际{state.num_qubits}")
     
-    # 验证初始状态
-    if not verify_initialization(state, m, n):
+    # 验证初始状态：完整验证需要遍历整个状态向量；不验证时，只检查|0⟩分量的振幅为1，
+    # 对归一化的状态这已保证其余分量全为0
+    if validate:
+        if not verify_initialization(state, m, n):
+            raise ValueError("输入状态不是有效的|0⟩⊗m |0⟩⊗n状态")
+    elif abs(state.state[0] - 1) > state_tolerance(state.state.dtype):
         raise ValueError("输入状态不是有效的|0⟩⊗m |0⟩⊗n状态")
     
-    # 创建Hadamard门
-    hadamard = create_hadamard_gate()
+    # H^(⊗m)|0⟩⊗m 的结果已知为均匀叠加态，直接写出 (1/√Q) ∑|x⟩|0⟩，
+    # 即在索引 x·2^n (x = 0, ..., Q-1) 处写入 1/√Q，无需逐个量子比特应用Hadamard门
+    Q = 1 << m
+    new_state = np.zeros(1 << (m + n), dtype=state.state.dtype)
+    support = np.arange(Q, dtype=np.int64) << n
+    new_state[support] = 1.0 / math.sqrt(Q)
+    
+    result = QuantumRegister.from_array(new_state)
+    result.support = support
+    return result
+
+def create_sparse_superposition(m: int, n: int, dtype=DTYPE) -> SparseQuantumRegister:
+    """
+    直接创建稀疏表示的均匀叠加态 (1/√Q) ∑|x⟩|0⟩
     
-    # 对第一寄存器的每个量子比特应用Hadamard门
-    current_register = state
-    for i in range(m):
-        current_register = hadamard.apply_to_register(current_register, [i])
+    结果与对|0⟩⊗m |0⟩⊗n 应用 apply_hadamard_to_first_register 相同，但只保存
+    Q = 2^m 个非零振幅，不分配2^(m+n)维的状态向量。
     
-    return current_register
+    参数:
+        m: 第一寄存器的量子比特数
+        n: 第二寄存器的量子比特数
+        dtype: 振幅数据类型，np.complex128（默认）或np.complex64
+        
+    返回:
+        SparseQuantumRegister: 稀疏表示的叠加态
+    """
+    Q = 1 << m
+    indices = np.arange(Q, dtype=np.int64) << n
+    amplitudes = np.full(Q, 1.0 / math.sqrt(Q), dtype=dtype)
+    return SparseQuantumRegister(m + n, indices, amplitudes)
 
 def verify_superposition(state: QuantumRegister, m: int, n: int) -> bool:
     """
@@ -53,15 +84,25 @@ def verify_superposition(state: QuantumRegister, m: int, n: int) -> bool:
     """
     # 计算第一寄存器的状态数
     Q = 2**m
+    tolerance = state_tolerance(state.state.dtype)
+    
+    # 已知可能非零的分量（support）时只检查这些分量，其余分量必为0
+    candidates = state.support
+    s = state.state if candidates is None else state.state[candidates]
+    
+    # 各分量的模平方只计算一次，后续比较都在模平方上进行，无需开方
+    squared_magnitudes = s.real * s.real + s.imag * s.imag
     
     # 检查归一化
-    norm = math.sqrt(sum(abs(x)**2 for x in state.state))
-    if not abs(norm - 1.0) < 1e-10:
+    norm = math.sqrt(squared_magnitudes.sum())
+    if not abs(norm - 1.0) < tolerance:
         print(f"错误：量子态未归一化，范数为{norm}")
         return False
     
-    # 检查非零元素的数量和值
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
+    # 检查非零元素的数量和值（|α|² > 1e-20 即 |α| > 1e-10）
+    non_zero_positions = np.flatnonzero(squared_magnitudes > 1e-20)
+    non_zero_indices = non_zero_positions if candidates is None else candidates[non_zero_positions]
+    non_zero_squared = squared_magnitudes[non_zero_positions]
     expected_amplitude = 1 / math.sqrt(Q)
     
     # 应该有Q个非零元素（对应第一寄存器的所有可能状态）
@@ -70,17 +111,19 @@ def verify_superposition(state: QuantumRegister, m: int, n: int) -> bool:
         return False
     
     # 检查所有非零元素的振幅是否正确
-    for i in non_zero_indices:
-        if not abs(abs(state.state[i]) - expected_amplitude) < 1e-10:
-            print(f"错误：状态{i}的振幅不正确，应为{expected_amplitude}，实际为{abs(state.state[i])}")
-            return False
-    
-    # 检查非零元素是否都在第二寄存器为|0⟩的位置
-    for i in non_zero_indices:
-        # 索引i应该满足 i % 2^n == 0（第二寄存器为|0⟩）
-        if i % (2**n) != 0:
-            print(f"错误：状态{i}的第二寄存器不为|0⟩")
-            return False
+    # |α|与期望振幅相差tolerance时，|α|²约相差 2·expected_amplitude·tolerance
+    deviations = np.abs(non_zero_squared - expected_amplitude * expected_amplitude)
+    if not np.all(deviations < 2 * expected_amplitude * tolerance):
+        bad = int(np.argmax(deviations))
+        i = non_zero_indices[bad]
+        print(f"错误：状态{i}的振幅不正确，应为{expected_amplitude}，实际为{math.sqrt(non_zero_squared[bad])}")
+        return False
+    
+    # 检查非零元素是否都在第二寄存器为|0⟩的位置（索引的低n位全为0）
+    bad_indices = non_zero_indices[(non_zero_indices & ((1 << n) - 1)) != 0]
+    if len(bad_indices) > 0:
+        print(f"错误：状态{bad_indices[0]}的第二寄存器不为|0⟩")
+        return False
     
     return True
 
@@ -101,24 +144,23 @@ def print_superposition_info(state: QuantumRegister, m: int, n: int) -> None:
     print(f"  理论振幅 (1/√Q): {expected_amplitude:.6f}")
     
     # 显示前几个和最后几个非零元素
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
-    print(f"  非零元素数量: {len(non_zero_indices)}")
+    non_zero_count, first_indices, last_indices = state.nonzero_summary(5)
+    print(f"  非零元素数量: {non_zero_count}")
     
-    if len(non_zero_indices) > 0:
+    if non_zero_count > 0:
+        mask_n = (1 << n) - 1
         print(f"  前5个非零元素:")
-        for i in range(min(5, len(non_zero_indices))):
-            idx = non_zero_indices[i]
-            first_reg = idx // (2**n)
-            second_reg = idx % (2**n)
+        for idx in first_indices:
+            first_reg = idx >> n
+            second_reg = idx & mask_n
             print(f"    |{first_reg}⟩|{second_reg}⟩: {state.state[idx]}")
         
-        if len(non_zero_indices) > 5:
+        if non_zero_count > 5:
             print(f"    ...")
             print(f"  最后5个非零元素:")
-            for i in range(max(0, len(non_zero_indices) - 5), len(non_zero_indices)):
-                idx = non_zero_indices[i]
-                first_reg = idx // (2**n)
-                second_reg = idx % (2**n)
+            for idx in last_indices:
+                first_reg = idx >> n
+                second_reg = idx & mask_n
                 print(f"    |{first_reg}⟩|{second_reg}⟩: {state.state[idx]}")
 
 def create_superposition_circuit(m: int, n: int) -> QuantumRegister:
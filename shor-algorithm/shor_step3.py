@@ -6,11 +6,78 @@ Shor算法步骤3：量子模幂运算
 执行后的状态：|ψ₂⟩ = (1/√Q) ∑_{x=0}^{Q-1} |x⟩|a^x mod N⟩
 """
 
+import functools
 import math
 from typing import List
-from shor_definitions import QuantumRegister, QuantumGate
+import numpy as np
+from shor_definitions import NUMBA_AVAILABLE, QuantumRegister, QuantumGate, SparseQuantumRegister, njit, prange, state_tolerance
 from shor_step2 import verify_superposition
 
+@functools.lru_cache(maxsize=None)
+def _modular_power_period(a: int, N: int) -> np.ndarray:
+    """
+    计算一个周期内的 a^i mod N，i = 0, 1, ..., r-1，其中r是a模N的阶
+    
+    a与N互质时序列 a^i mod N 是纯周期的，周期r ≤ N，因此只需计算前r项。
+    结果按(a, N)缓存，返回只读数组。
+    """
+    table = np.empty(N, dtype=np.int64)
+    value = 1 % N
+    for i in range(N):
+        table[i] = value
+        value = (value * a) % N
+        if value == 1:
+            table = table[:i + 1]
+            break
+    table.flags.writeable = False
+    return table
+
+def modular_exponentiation_table(a: int, N: int, m: int) -> np.ndarray:
+    """
+    计算 a^x mod N，x = 0, 1, ..., 2^m - 1
+    
+    参数:
+        a: 底数
+        N: 模数
+        m: 第一寄存器的量子比特数
+        
+    返回:
+        np.ndarray: 长度为2^m的int64数组，第x项为 a^x mod N
+    """
+    # a与N不互质时序列不是纯周期的，在前一项基础上逐项乘a，每项只需一次模乘
+    if math.gcd(a, N) != 1:
+        table = np.empty(1 << m, dtype=np.int64)
+        value = 1 % N
+        for i in range(1 << m):
+            table[i] = value
+            value = (value * a) % N
+        return table
+    
+    x = np.arange(1 << m, dtype=np.int64)
+    period_table = _modular_power_period(a, N)
+    return period_table[x % len(period_table)]
+
+@njit(cache=True, fastmath=True, parallel=True)
+def _apply_modexp_kernel(state_in, state_out, a_pow_x, n):
+    """
+    模幂运算内核：state_out[|x⟩|y ⊕ a^x mod N⟩] = state_in[|x⟩|y⟩]
+    
+    变换是双射，每个输出分量只被写入一次；输出已置零，零振幅直接跳过。
+    不同x只读写各自的2^n个分量，互不重叠，按x并行处理。
+    
+    参数:
+        state_in: 输入状态向量
+        state_out: 输出状态向量（调用前置零）
+        a_pow_x: a^x mod N 的查找表，长度为2^m
+        n: 第二寄存器量子比特数
+    """
+    for x in prange(a_pow_x.shape[0]):
+        base = x << n
+        for y in range(1 << n):
+            amplitude = state_in[base | y]
+            if amplitude != 0:
+                state_out[base | (y ^ a_pow_x[x])] = amplitude
+
 class ModularExponentiationGate:
     """
     模幂运算量子门（无矩阵版）
@@ -41,22 +108,22 @@ class ModularExponentiationGate:
         self.num_qubits = m + n
         self.name = f"ModularExponentiation(a={a}, N={N})"
         
-        # 预计算映射关系，而不是构建完整的矩阵
-        self.input_to_output = {}
+        # 预计算 a^x mod N 查找表，只依赖于x
+        self.a_pow_x = modular_exponentiation_table(a, N, m)
+        self._permutation = None
+    
+    @property
+    def permutation(self) -> np.ndarray:
+        """
+        基态索引置换表，permutation[(x<<n)|y] = (x<<n)|(y ⊕ a^x mod N)
         
-        # 计算所有非零元素的映射关系
-        for x in range(2 ** m):
-            for y in range(2 ** n):
-                # 计算输入索引 |x⟩|y⟩
-                input_idx = (x << n) | y
-                
-                # 计算输出索引 |x⟩|y ⊕ a^x mod N⟩
-                a_pow_x = pow(a, x, N)
-                output_y = y ^ a_pow_x  # 使用异或运算
-                output_idx = (x << n) | output_y
-                
-                # 存储映射关系
-                self.input_to_output[input_idx] = output_idx
+        首次访问时构建，长度为2^(m+n)。
+        """
+        if self._permutation is None:
+            x = np.arange(1 << self.m, dtype=np.int64)[:, None]
+            y = np.arange(1 << self.n, dtype=np.int64)[None, :]
+            self._permutation = ((x << self.n) | (y ^ self.a_pow_x[:, None])).ravel()
+        return self._permutation
     
     def apply_to_register(self, register: 'QuantumRegister', target_qubits: List[int]) -> 'QuantumRegister':
         """
@@ -72,25 +139,81 @@ class ModularExponentiationGate:
         if len(target_qubits) != self.num_qubits:
             raise ValueError(f"量子门作用量子比特数({self.num_qubits})与目标量子比特数({len(target_qubits)})不匹配")
         
-        n = register.num_qubits
-        new_state = [0j] * len(register.state)
+        new_state = np.zeros_like(register.state)
+        
+        if NUMBA_AVAILABLE:
+            # 调用编译后的内核，按查找表逐个|x⟩置换第二寄存器
+            _apply_modexp_kernel(register.state, new_state, self.a_pow_x, self.n)
+        else:
+            # 置换是双射，一次NumPy散射即可完成
+            new_state[self.permutation] = register.state
+        
+        # 置换保持归一化，新数组直接作为状态向量，不再经过set_state的复制和归一化
+        new_register = QuantumRegister.from_array(new_state)
+        
+        # 输入的非零分量已知时，其在置换下的像就是输出的非零分量
+        if register.support is not None:
+            mapped = register.support ^ self.a_pow_x[register.support >> self.n]
+            new_register.support = np.sort(mapped)
+        return new_register
+    
+    def apply_to_zero_second_register(self, register: 'QuantumRegister') -> 'QuantumRegister':
+        """
+        对第二寄存器为|0⟩的量子态应用模幂运算门
+        
+        输入形如 ∑α_x|x⟩|0⟩ 时，y ⊕ a^x mod N = a^x mod N，变换退化为
+        |x⟩|0⟩ → |x⟩|a^x mod N⟩ 的散射，只需处理2^m个振幅。
+        调用方需保证输入的第二寄存器为|0⟩。
         
-        # 使用预计算的映射关系，只处理非零元素
-        for input_idx, amplitude in enumerate(register.state):
-            if abs(amplitude) < 1e-10:
-                continue
+        参数:
+            register: 第二寄存器为|0⟩的量子寄存器
             
-            # 使用预计算的映射关系
-            if input_idx in self.input_to_output:
-                output_idx = self.input_to_output[input_idx]
-                new_state[output_idx] += amplitude
+        返回:
+            QuantumRegister: 应用量子门后的新量子寄存器
+        """
+        if register.num_qubits != self.num_qubits:
+            raise ValueError(f"量子门作用量子比特数({self.num_qubits})与寄存器量子比特数({register.num_qubits})不匹配")
+        
+        x_indices = np.arange(1 << self.m, dtype=np.int64) << self.n
+        support = x_indices | self.a_pow_x
+        new_state = np.zeros_like(register.state)
+        new_state[support] = register.state[x_indices]
         
-        # 创建新的量子寄存器
-        new_register = QuantumRegister(n)
-        new_register.set_state(new_state)
+        # 非零分量只可能出现在 |x⟩|a^x mod N⟩，这些索引按x升序
+        new_register = QuantumRegister.from_array(new_state)
+        new_register.support = support
         return new_register
 
-def apply_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int, n: int) -> QuantumRegister:
+@functools.lru_cache(maxsize=8)
+def get_modular_exponentiation_gate(a: int, N: int, m: int, n: int) -> ModularExponentiationGate:
+    """
+    获取给定(a, N, m, n)的模幂运算门，结果按参数缓存
+    
+    同一组参数的查找表和置换表只构建一次，在多次尝试之间复用。置换表每个基态占8字节，
+    因此只缓存最近使用的8个门，开始分解新的N之前可调用 clear_modular_exponentiation_cache 释放。
+    
+    参数:
+        a: 底数
+        N: 模数
+        m: 第一寄存器量子比特数
+        n: 第二寄存器量子比特数
+        
+    返回:
+        ModularExponentiationGate: 模幂运算门
+    """
+    return ModularExponentiationGate(a, N, m, n)
+
+def clear_modular_exponentiation_cache() -> None:
+    """
+    清空模幂运算门及 a^x mod N 周期表的缓存
+    
+    缓存只对同一N有效，开始分解新的N之前应清空，释放门持有的查找表和置换表。
+    """
+    get_modular_exponentiation_gate.cache_clear()
+    _modular_power_period.cache_clear()
+
+def apply_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int, n: int,
+                                 validate: bool = False) -> QuantumRegister:
     """
     应用模幂运算 U_a: |x⟩|y⟩ → |x⟩|y ⊕ a^x mod N⟩
     
@@ -100,6 +223,7 @@ def apply_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int,
         N: 模数
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        validate: 为True时验证输入是有效的叠加态
         
     返回:
         QuantumRegister: 应用模幂运算后的量子态 (1/√Q) ∑|x⟩|a^x mod N⟩
@@ -112,7 +236,7 @@ def apply_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int,
         raise ValueError(f"量子寄存器大小不匹配，期望{m+n}，实际{state.num_qubits}")
     
     # 验证叠加态
-    if not verify_superposition(state, m, n):
+    if validate and not verify_superposition(state, m, n):
         raise ValueError("输入状态不是有效的叠加态 (1/√Q) ∑|x⟩|0⟩")
     
     # 验证a和N的有效性
@@ -123,14 +247,57 @@ def apply_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int,
     if math.gcd(a, N) != 1:
         raise ValueError(f"底数a和模数N必须互质，gcd({a}, {N}) = {math.gcd(a, N)}")
     
-    # 创建模幂运算门
-    mod_exp_gate = ModularExponentiationGate(a, N, m, n)
+    # 获取模幂运算门（按参数缓存）
+    mod_exp_gate = get_modular_exponentiation_gate(a, N, m, n)
     
-    # 应用模幂运算门
-    result_state = mod_exp_gate.apply_to_register(state, list(range(m + n)))
+    # 第二寄存器为|0⟩的分量概率之和为1时，其余分量全为0，只需按查找表散射2^m个振幅；
+    # 该检查只读取2^m个振幅
+    zero_column = state.state[::1 << n]
+    if abs(np.vdot(zero_column, zero_column).real - 1.0) < state_tolerance(state.state.dtype):
+        result_state = mod_exp_gate.apply_to_zero_second_register(state)
+    else:
+        result_state = mod_exp_gate.apply_to_register(state, list(range(m + n)))
     
     return result_state
 
+def apply_modular_exponentiation_sparse(state: SparseQuantumRegister, a: int, N: int,
+                                        m: int, n: int) -> SparseQuantumRegister:
+    """
+    对稀疏表示的量子态应用模幂运算 |x⟩|y⟩ → |x⟩|y ⊕ a^x mod N⟩
+    
+    变换是基态索引的置换，只需对每个非零分量改写索引，工作量与非零分量数成正比。
+    
+    参数:
+        state: 稀疏表示的量子态（通常来自 create_sparse_superposition）
+        a: 底数
+        N: 模数
+        m: 第一寄存器的量子比特数
+        n: 第二寄存器的量子比特数
+        
+    返回:
+        SparseQuantumRegister: 模幂运算后的稀疏量子态
+        
+    异常:
+        ValueError: 如果输入状态不正确或参数无效
+    """
+    # 输入验证
+    if state.num_qubits != m + n:
+        raise ValueError(f"量子寄存器大小不匹配，期望{m+n}，实际{state.num_qubits}")
+    
+    # 验证a和N的有效性
+    if not (1 < a < N):
+        raise ValueError(f"底数a必须满足1 < a < N，得到a={a}, N={N}")
+    
+    # 验证a和N互质
+    if math.gcd(a, N) != 1:
+        raise ValueError(f"底数a和模数N必须互质，gcd({a}, {N}) = {math.gcd(a, N)}")
+    
+    a_pow_x = modular_exponentiation_table(a, N, m)
+    x = state.indices >> n
+    new_indices = state.indices ^ a_pow_x[x]
+    
+    return SparseQuantumRegister(m + n, new_indices, state.amplitudes)
+
 def verify_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int, n: int) -> bool:
     """
     验证模幂运算是否正确应用
@@ -145,14 +312,25 @@ def verify_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int
     返回:
         bool: 如果模幂运算正确返回True，否则返回False
     """
+    tolerance = state_tolerance(state.state.dtype)
+    
+    # 已知可能非零的分量（support）时只检查这些分量，其余分量必为0
+    candidates = state.support
+    s = state.state if candidates is None else state.state[candidates]
+    
+    # 各分量的模平方只计算一次，后续比较都在模平方上进行，无需开方
+    squared_magnitudes = s.real * s.real + s.imag * s.imag
+    
     # 检查归一化
-    norm = math.sqrt(sum(abs(x)**2 for x in state.state))
-    if not abs(norm - 1.0) < 1e-10:
+    norm = math.sqrt(squared_magnitudes.sum())
+    if not abs(norm - 1.0) < tolerance:
         print(f"错误：量子态未归一化，范数为{norm}")
         return False
     
-    # 检查非零元素的数量和值
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
+    # 检查非零元素的数量和值（|α|² > 1e-20 即 |α| > 1e-10）
+    non_zero_positions = np.flatnonzero(squared_magnitudes > 1e-20)
+    non_zero_indices = non_zero_positions if candidates is None else candidates[non_zero_positions]
+    non_zero_squared = squared_magnitudes[non_zero_positions]
     expected_count = 2 ** m  # 应该有2^m个非零元素
     
     if len(non_zero_indices) != expected_count:
@@ -161,23 +339,27 @@ def verify_modular_exponentiation(state: QuantumRegister, a: int, N: int, m: int
     
     # 验证模幂运算结果
     expected_amplitude = 1 / math.sqrt(2 ** m)
+    a_pow_x = modular_exponentiation_table(a, N, m)
     
-    for idx in non_zero_indices:
-        # 分离第一和第二寄存器的值
-        x = idx >> n  # 第一寄存器的值
-        y = idx & ((1 << n) - 1)  # 第二寄存器的值
-        
-        # 计算期望的第二寄存器值
-        expected_y = pow(a, x, N)
-        
-        if y != expected_y:
-            print(f"错误：状态|{x}⟩|{y}⟩的第二寄存器值不正确，应为|{x}⟩|{expected_y}⟩")
-            return False
-        
-        # 检查振幅
-        if not abs(abs(state.state[idx]) - expected_amplitude) < 1e-10:
-            print(f"错误：状态|{x}⟩|{y}⟩的振幅不正确，应为{expected_amplitude}，实际为{abs(state.state[idx])}")
-            return False
+    # 分离第一和第二寄存器的值
+    x = non_zero_indices >> n
+    y = non_zero_indices & ((1 << n) - 1)
+    
+    # 每个非零元素的第二寄存器值应为 a^x mod N
+    wrong = np.flatnonzero(y != a_pow_x[x])
+    if len(wrong) > 0:
+        i = wrong[0]
+        print(f"错误：状态|{x[i]}⟩|{y[i]}⟩的第二寄存器值不正确，应为|{x[i]}⟩|{a_pow_x[x[i]]}⟩")
+        return False
+    
+    # 检查振幅
+    # |α|与期望振幅相差tolerance时，|α|²约相差 2·expected_amplitude·tolerance
+    deviations = np.abs(non_zero_squared - expected_amplitude * expected_amplitude)
+    if not np.all(deviations < 2 * expected_amplitude * tolerance):
+        i = int(np.argmax(deviations))
+        magnitude = math.sqrt(non_zero_squared[i])
+        print(f"错误：状态|{x[i]}⟩|{y[i]}⟩的振幅不正确，应为{expected_amplitude}，实际为{magnitude}")
+        return False
     
     return True
 
@@ -200,27 +382,27 @@ def print_modular_exponentiation_info(state: QuantumRegister, a: int, N: int, m:
     print(f"  理论振幅 (1/√2^m): {1/math.sqrt(2**m):.6f}")
     
     # 显示前几个和最后几个非零元素
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
-    print(f"  非零元素数量: {len(non_zero_indices)}")
+    non_zero_count, first_indices, last_indices = state.nonzero_summary(5)
+    print(f"  非零元素数量: {non_zero_count}")
     
-    if len(non_zero_indices) > 0:
+    if non_zero_count > 0:
+        mask_n = (1 << n) - 1
         print(f"  前5个非零元素:")
-        for i in range(min(5, len(non_zero_indices))):
-            idx = non_zero_indices[i]
+        for idx in first_indices:
             first_reg = idx >> n
-            second_reg = idx & ((1 << n) - 1)
+            second_reg = idx & mask_n
             print(f"    |{first_reg}⟩|{second_reg}⟩: {state.state[idx]}")
         
-        if len(non_zero_indices) > 5:
+        if non_zero_count > 5:
             print(f"    ...")
             print(f"  最后5个非零元素:")
-            for i in range(max(0, len(non_zero_indices) - 5), len(non_zero_indices)):
-                idx = non_zero_indices[i]
+            for idx in last_indices:
                 first_reg = idx >> n
-                second_reg = idx & ((1 << n) - 1)
+                second_reg = idx & mask_n
                 print(f"    |{first_reg}⟩|{second_reg}⟩: {state.state[idx]}")
 
-def create_modular_exponentiation_circuit(initial_state, a: int, N: int, m: int, n: int) -> QuantumRegister:
+def create_modular_exponentiation_circuit(initial_state, a: int, N: int, m: int, n: int,
+                                          validate: bool = False) -> QuantumRegister:
     """
     创建模幂运算的完整电路实现
     
@@ -230,14 +412,16 @@ def create_modular_exponentiation_circuit(initial_state, a: int, N: int, m: int,
         N: 模数
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        validate: 为True时验证初始叠加态和模幂运算结果
         
     返回:
         QuantumRegister: 应用模幂运算后的量子态
     """
     # 步骤1：验证初始状态
-    print(f"步骤1：验证初始叠加态")
-    if not verify_superposition(initial_state, m, n):
-        raise RuntimeError("初始叠加态验证失败")
+    if validate:
+        print(f"步骤1：验证初始叠加态")
+        if not verify_superposition(initial_state, m, n):
+            raise RuntimeError("初始叠加态验证失败")
     
     # 步骤2：应用模幂运算
     print(f"步骤2：应用模幂运算 U_a: |x⟩|y⟩ → |x⟩|y ⊕ a^x mod N⟩")
@@ -248,10 +432,12 @@ def create_modular_exponentiation_circuit(initial_state, a: int, N: int, m: int,
     result_state = apply_modular_exponentiation(initial_state, a, N, m, n)
     
     # 验证结果
-    if not verify_modular_exponentiation(result_state, a, N, m, n):
-        raise RuntimeError("模幂运算应用失败")
-    
-    print(f"✓ 成功应用模幂运算 (1/√{2**m}) ∑_{{x=0}}^{{2**{m}-1}} |x⟩|a^x mod {N}⟩")
+    if validate:
+        if not verify_modular_exponentiation(result_state, a, N, m, n):
+            raise RuntimeError("模幂运算应用失败")
+        print(f"✓ 成功应用模幂运算 (1/√{2**m}) ∑_{{x=0}}^{{2**{m}-1}} |x⟩|a^x mod {N}⟩")
+    else:
+        print(f"已应用模幂运算（未验证结果）")
     
     return result_state
 
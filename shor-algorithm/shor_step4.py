@@ -7,11 +7,57 @@ Shor算法步骤4：测量第二寄存器
 """
 
 import math
-import random
-from typing import List, Tuple
-from shor_definitions import QuantumRegister
+from typing import Optional, Tuple
+import numpy as np
+from shor_definitions import QuantumRegister, SparseQuantumRegister, sample_index, state_tolerance
 from shor_step3 import verify_modular_exponentiation
 
+def _normalized_column(state: QuantumRegister, m: int, n: int, measurement_result: int,
+                       norm: Optional[float] = None) -> np.ndarray:
+    """
+    取出第二寄存器等于测量结果的那一列振幅并归一化
+    
+    参数:
+        state: 原始量子态
+        m: 第一寄存器的量子比特数
+        n: 第二寄存器的量子比特数
+        measurement_result: 第二寄存器的测量结果
+        norm: 该列的范数；调用方已知时传入以免重复计算
+        
+    返回:
+        np.ndarray: 长度为2^m的归一化振幅向量
+        
+    异常:
+        ValueError: 如果没有与测量结果匹配的分量
+    """
+    # 将状态向量视为 2^m × 2^n 矩阵，取第二寄存器等于测量结果的那一列
+    column = state.state.reshape(1 << m, 1 << n)[:, measurement_result]
+    
+    if norm is None:
+        norm = np.linalg.norm(column)
+    if norm <= 1e-10:
+        raise ValueError("测量后没有匹配的量子态分量")
+    
+    return column / norm
+
+def _collapsed_register(state: QuantumRegister, m: int, n: int, measurement_result: int,
+                        norm: Optional[float] = None) -> QuantumRegister:
+    """
+    构造第二寄存器坍缩到测量结果后的量子寄存器
+    
+    参数与 _normalized_column 相同。
+    
+    返回:
+        QuantumRegister: 坍缩后的量子态，support为第二寄存器等于测量结果的2^m个分量
+    """
+    new_state = np.zeros_like(state.state)
+    new_state.reshape(1 << m, 1 << n)[:, measurement_result] = _normalized_column(
+        state, m, n, measurement_result, norm)
+    
+    collapsed_register = QuantumRegister.from_array(new_state)
+    collapsed_register.support = (np.arange(1 << m, dtype=np.int64) << n) | measurement_result
+    return collapsed_register
+
 def measure_second_register(state: QuantumRegister, m: int, n: int) -> Tuple[QuantumRegister, int]:
     """
     测量第二寄存器，根据概率随机选择一个状态
@@ -33,18 +79,77 @@ def measure_second_register(state: QuantumRegister, m: int, n: int) -> Tuple[Qua
     if state.num_qubits != m + n:
         raise ValueError(f"量子寄存器大小不匹配，期望{m+n}，实际{state.num_qubits}")
     
-    # 计算第二寄存器各值的概率
-    probabilities = calculate_measurement_probabilities(state, m, n)
+    return measure_and_collapse_second(state, m, n)
+
+def measure_and_collapse_second(state: QuantumRegister, m: int, n: int) -> Tuple[QuantumRegister, int]:
+    """
+    在一次遍历中完成第二寄存器的概率计算、采样和坍缩
+    
+    |α|²只计算一次：按列求和得到测量概率，被测列的概率之和的平方根即为坍缩后的归一化因子，
+    无需再次读取整个状态向量。
+    
+    参数:
+        state: 当前量子态
+        m: 第一寄存器的量子比特数
+        n: 第二寄存器的量子比特数
+        
+    返回:
+        Tuple[QuantumRegister, int]: 坍缩后的量子态和测量结果 y₀
+        
+    异常:
+        ValueError: 如果没有与测量结果匹配的分量
+    """
+    probabilities = state.probabilities().reshape(1 << m, 1 << n).sum(axis=0)
     
     # 根据概率随机选择测量结果
-    measurement_result = random.choices(range(2**n), weights=probabilities)[0]
+    measurement_result = sample_index(probabilities)
     
-    # 量子态坍缩
-    collapsed_state = collapse_quantum_state(state, m, n, measurement_result)
+    # 被测列的概率之和的平方根即为坍缩后的归一化因子
+    norm = math.sqrt(probabilities[measurement_result])
+    return _collapsed_register(state, m, n, measurement_result, norm), measurement_result
+
+def measure_second_register_sparse(state: SparseQuantumRegister, m: int, n: int) -> Tuple[np.ndarray, int]:
+    """
+    测量稀疏表示的量子态的第二寄存器，只返回第一寄存器的约化态
     
-    return collapsed_state, measurement_result
+    结果与 reduce_to_first_register 取出的约化态相同，但只遍历非零分量，不需要稠密的状态向量。
+    
+    参数:
+        state: 稀疏表示的量子态 (1/√Q) ∑|x⟩|a^x mod N⟩
+        m: 第一寄存器的量子比特数
+        n: 第二寄存器的量子比特数
+        
+    返回:
+        Tuple[np.ndarray, int]: 
+            - 测量后第一寄存器的归一化振幅向量 (1/√M) ∑|x₀ + kr⟩
+            - 测量结果 y₀
+            
+    异常:
+        ValueError: 如果输入状态不正确或参数无效
+    """
+    # 输入验证
+    if state.num_qubits != m + n:
+        raise ValueError(f"量子寄存器大小不匹配，期望{m+n}，实际{state.num_qubits}")
+    
+    # 按第二寄存器的值累加各非零分量的概率，并随机选择测量结果
+    y = state.indices & ((1 << n) - 1)
+    probabilities = np.bincount(y, weights=state.probabilities(), minlength=1 << n)
+    measurement_result = sample_index(probabilities)
+    
+    # 第二寄存器等于测量结果的分量组成第一寄存器的约化态
+    selected = y == measurement_result
+    first_register = np.zeros(1 << m, dtype=state.amplitudes.dtype)
+    first_register[state.indices[selected] >> n] = state.amplitudes[selected]
+    
+    # 重新归一化
+    norm = np.linalg.norm(first_register)
+    if norm <= 1e-10:
+        raise ValueError("测量后没有匹配的量子态分量")
+    
+    return first_register / norm, measurement_result
 
-def calculate_measurement_probabilities(state: QuantumRegister, m: int, n: int) -> List[float]:
+def calculate_measurement_probabilities(state: QuantumRegister, m: int, n: int,
+                                        squared_magnitudes: Optional[np.ndarray] = None) -> np.ndarray:
     """
     计算第二寄存器各值的测量概率
     
@@ -52,24 +157,19 @@ def calculate_measurement_probabilities(state: QuantumRegister, m: int, n: int)
         state: 量子寄存器状态
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        squared_magnitudes: 已计算好的各基态概率|α|²（可选），提供时直接复用
         
     返回:
-        List[float]: 第二寄存器各值的概率列表
+        np.ndarray: 第二寄存器各值的概率数组，长度为2^n
     """
-    # 初始化概率数组
-    probabilities = [0.0] * (2 ** n)
+    if squared_magnitudes is not None:
+        return squared_magnitudes.reshape(1 << m, 1 << n).sum(axis=0)
     
-    # 计算每个y值的概率
-    for idx, amplitude in enumerate(state.state):
-        if abs(amplitude) < 1e-10:
-            continue
-            
-        # 分离第一和第二寄存器的值
-        x = idx >> n  # 第一寄存器的值
-        y = idx & ((1 << n) - 1)  # 第二寄存器的值
-        
-        # 将振幅的平方概率加到对应的y值上
-        probabilities[y] += abs(amplitude) ** 2
+    # 将状态向量视为 2^m × 2^n 矩阵，行为第一寄存器x，列为第二寄存器y
+    amplitudes = state.state.reshape(1 << m, 1 << n)
+    
+    # 对每个y值，沿第一寄存器累加振幅的平方
+    probabilities = np.einsum('ij,ij->j', amplitudes.conj(), amplitudes).real
     
     return probabilities
 
@@ -85,38 +185,32 @@ def collapse_quantum_state(state: QuantumRegister, m: int, n: int, measurement_r
         
     返回:
         QuantumRegister: 坍缩后的量子态
+        
+    异常:
+        ValueError: 如果没有与测量结果匹配的分量
     """
-    # 创建新的量子态向量
-    new_state = [0j] * len(state.state)
+    return _collapsed_register(state, m, n, measurement_result)
+
+def reduce_to_first_register(state: QuantumRegister, m: int, n: int, measurement_result: int) -> np.ndarray:
+    """
+    取出第二寄存器为测量结果时第一寄存器的归一化振幅
     
-    # 保留与测量结果匹配的分量
-    matching_indices = []
-    for idx, amplitude in enumerate(state.state):
-        if abs(amplitude) < 1e-10:
-            continue
-            
-        # 分离第一和第二寄存器的值
-        y = idx & ((1 << n) - 1)  # 第二寄存器的值
+    参数:
+        state: 原始量子态
+        m: 第一寄存器的量子比特数
+        n: 第二寄存器的量子比特数
+        measurement_result: 第二寄存器的测量结果
         
-        # 如果第二寄存器的值等于测量结果，保留该分量
-        if y == measurement_result:
-            new_state[idx] = amplitude
-            matching_indices.append(idx)
-    
-    # 重新归一化
-    norm = math.sqrt(sum(abs(x)**2 for x in new_state))
-    if norm > 1e-10:
-        new_state = [x / norm for x in new_state]
-    else:
-        raise ValueError("测量后没有匹配的量子态分量")
-    
-    # 创建新的量子寄存器
-    collapsed_register = QuantumRegister(m + n)
-    collapsed_register.set_state(new_state)
-    
-    return collapsed_register
+    返回:
+        np.ndarray: 长度为2^m的归一化振幅向量
+        
+    异常:
+        ValueError: 如果没有与测量结果匹配的分量
+    """
+    return _normalized_column(state, m, n, measurement_result)
 
-def verify_measurement_result(state: QuantumRegister, m: int, n: int, measurement_result: int) -> bool:
+def verify_measurement_result(state: QuantumRegister, m: int, n: int, measurement_result: int,
+                              squared_magnitudes: Optional[np.ndarray] = None) -> bool:
     """
     验证测量结果是否正确
     
@@ -125,28 +219,35 @@ def verify_measurement_result(state: QuantumRegister, m: int, n: int, measuremen
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
         measurement_result: 测量结果
+        squared_magnitudes: 已计算好的各基态概率|α|²（可选），提供时直接复用
         
     返回:
         bool: 如果测量结果正确返回True，否则返回False
     """
+    if squared_magnitudes is None:
+        squared_magnitudes = state.probabilities()
+    
     # 检查归一化
-    norm = math.sqrt(sum(abs(x)**2 for x in state.state))
-    if not abs(norm - 1.0) < 1e-10:
+    norm = math.sqrt(squared_magnitudes.sum())
+    if not abs(norm - 1.0) < state_tolerance(state.state.dtype):
         print(f"错误：量子态未归一化，范数为{norm}")
         return False
     
-    # 检查所有非零分量的第二寄存器值是否等于测量结果
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
+    # 检查所有非零分量（|α| > 1e-10）的第二寄存器值是否等于测量结果
+    mask_n = (1 << n) - 1
+    non_zero_indices = np.flatnonzero(squared_magnitudes > 1e-20)
+    mismatched = non_zero_indices[(non_zero_indices & mask_n) != measurement_result]
     
-    for idx in non_zero_indices:
-        y = idx & ((1 << n) - 1)  # 第二寄存器的值
-        if y != measurement_result:
-            print(f"错误：状态{idx}的第二寄存器值{y}不等于测量结果{measurement_result}")
-            return False
+    if mismatched.size > 0:
+        idx = int(mismatched[0])
+        y = idx & mask_n  # 第二寄存器的值
+        print(f"错误：状态{idx}的第二寄存器值{y}不等于测量结果{measurement_result}")
+        return False
     
     return True
 
-def print_measurement_info(state: QuantumRegister, measurement_result: int, m: int, n: int) -> None:
+def print_measurement_info(state: QuantumRegister, measurement_result: int, m: int, n: int,
+                           squared_magnitudes: Optional[np.ndarray] = None) -> None:
     """
     打印测量结果信息
     
@@ -155,21 +256,26 @@ def print_measurement_info(state: QuantumRegister, measurement_result: int, m: i
         measurement_result: 测量结果
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        squared_magnitudes: 已计算好的各基态概率|α|²（可选），提供时直接复用
     """
+    if squared_magnitudes is None:
+        squared_magnitudes = state.probabilities()
+    
     print(f"测量结果信息:")
     print(f"  测量结果 y₀: {measurement_result}")
     print(f"  测量结果二进制: {bin(measurement_result)[2:].zfill(n)}")
     
     # 显示非零元素
-    non_zero_indices = [i for i, x in enumerate(state.state) if abs(x) > 1e-10]
+    non_zero_indices = np.flatnonzero(squared_magnitudes > 1e-20)
     print(f"  非零元素数量: {len(non_zero_indices)}")
     
     if len(non_zero_indices) > 0:
+        mask_n = (1 << n) - 1
         print(f"  前5个非零元素:")
         for i in range(min(5, len(non_zero_indices))):
             idx = non_zero_indices[i]
             first_reg = idx >> n
-            second_reg = idx & ((1 << n) - 1)
+            second_reg = idx & mask_n
             print(f"    |{first_reg}⟩|{second_reg}⟩: {state.state[idx]}")
         
         if len(non_zero_indices) > 5:
@@ -178,15 +284,16 @@ def print_measurement_info(state: QuantumRegister, measurement_result: int, m: i
             for i in range(max(0, len(non_zero_indices) - 5), len(non_zero_indices)):
                 idx = non_zero_indices[i]
                 first_reg = idx >> n
-                second_reg = idx & ((1 << n) - 1)
+                second_reg = idx & mask_n
                 print(f"    |{first_reg}⟩|{second_reg}⟩: {state.state[idx]}")
     
     # 计算测量前的概率分布
     print(f"  测量概率分析:")
-    probabilities = calculate_measurement_probabilities(state, m, n)
+    probabilities = calculate_measurement_probabilities(state, m, n, squared_magnitudes)
     print(f"    测量结果的概率: {probabilities[measurement_result]:.6f}")
 
-def create_measurement_circuit(state: QuantumRegister, m: int, n: int) -> Tuple[QuantumRegister, int]:
+def create_measurement_circuit(state: QuantumRegister, m: int, n: int,
+                               verbose: bool = True) -> Tuple[QuantumRegister, int]:
     """
     创建测量的完整电路实现
     
@@ -194,39 +301,42 @@ def create_measurement_circuit(state: QuantumRegister, m: int, n: int) -> Tuple[
         state: 输入量子态 (1/√Q) ∑|x⟩|a^x mod N⟩
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        verbose: 是否打印各步骤说明和测量概率分布
         
     返回:
         Tuple[QuantumRegister, int]: 测量后的量子态和测量结果
     """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    
     # 步骤1：验证输入状态
-    print(f"步骤1：验证输入量子态")
+    log(f"步骤1：验证输入量子态")
     # 这里我们假设输入状态已经是模幂运算后的状态
     
     # 步骤2：计算测量概率
-    print(f"步骤2：计算第二寄存器各值的测量概率")
-    probabilities = calculate_measurement_probabilities(state, m, n)
+    log(f"步骤2：计算第二寄存器各值的测量概率")
+    probabilities = calculate_measurement_probabilities(state, m, n, state.probabilities())
     
     # 显示概率分布信息
-    print(f"  测量概率分布:")
-    for y, prob in enumerate(probabilities):
-        if prob > 1e-10:
-            print(f"    P(y={y}) = {prob:.6f}")
+    if verbose:
+        non_zero_y = np.nonzero(probabilities > 1e-10)[0]
+        print(f"  测量概率分布:")
+        print("\n".join(f"    P(y={y}) = {probabilities[y]:.6f}" for y in non_zero_y))
     
     # 步骤3：执行测量
-    print(f"步骤3：测量第二寄存器")
-    measurement_result = random.choices(range(2**n), weights=probabilities)[0]
-    print(f"  测量结果: y₀ = {measurement_result} (二进制: {bin(measurement_result)[2:].zfill(n)})")
+    log(f"步骤3：测量第二寄存器")
+    measurement_result = sample_index(probabilities)
+    log(f"  测量结果: y₀ = {measurement_result} (二进制: {bin(measurement_result)[2:].zfill(n)})")
     
     # 步骤4：量子态坍缩
-    print(f"步骤4：量子态坍缩")
+    log(f"步骤4：量子态坍缩")
     collapsed_state = collapse_quantum_state(state, m, n, measurement_result)
-    print(f"  量子态已坍缩为 |ψ₃⟩ = (1/√M) ∑|x₀ + kr⟩|{measurement_result}⟩")
+    log(f"  量子态已坍缩为 |ψ₃⟩ = (1/√M) ∑|x₀ + kr⟩|{measurement_result}⟩")
     
     # 验证测量结果
     if not verify_measurement_result(collapsed_state, m, n, measurement_result):
         raise RuntimeError("测量结果验证失败")
     
-    print(f"✓ 成功完成第二寄存器测量")
+    log(f"✓ 成功完成第二寄存器测量")
     
     return collapsed_state, measurement_result
 
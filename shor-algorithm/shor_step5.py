@@ -4,11 +4,13 @@ Shor算法步骤5：量子傅里叶变换
 此文件包含了量子傅里叶变换所需的量子门和实现函数。
 """
 
+import functools
 import math
-from shor_definitions import QuantumGate, QuantumRegister
+import numpy as np
+from shor_definitions import DTYPE, QuantumGate, QuantumRegister, create_hadamard_gate, state_tolerance
 
 
-def create_controlled_phase_gate(angle: float) -> QuantumGate:
+def create_controlled_phase_gate(angle: float, dtype=DTYPE) -> QuantumGate:
     """
     创建受控相位门
     
@@ -19,6 +21,7 @@ def create_controlled_phase_gate(angle: float) -> QuantumGate:
     
     参数:
         angle: 相位角度θ
+        dtype: 矩阵元素数据类型，np.complex128（默认）或np.complex64
         
     返回:
         QuantumGate: 受控相位门对象
@@ -29,10 +32,10 @@ def create_controlled_phase_gate(angle: float) -> QuantumGate:
         [0+0j, 0+0j, 1+0j, 0+0j],
         [0+0j, 0+0j, 0+0j, complex(math.cos(angle), math.sin(angle))]
     ]
-    return QuantumGate(matrix, 2, f"ControlledPhase({angle})")
+    return QuantumGate(matrix, 2, f"ControlledPhase({angle})", check_unitary=False, dtype=dtype)
 
 
-def create_swap_gate() -> QuantumGate:
+def create_swap_gate(dtype=DTYPE) -> QuantumGate:
     """
     创建交换门
     
@@ -41,6 +44,9 @@ def create_swap_gate() -> QuantumGate:
             [0, 1, 0, 0],
             [0, 0, 0, 1]]
     
+    参数:
+        dtype: 矩阵元素数据类型，np.complex128（默认）或np.complex64
+    
     返回:
         QuantumGate: 交换门对象
     """
@@ -50,7 +56,37 @@ def create_swap_gate() -> QuantumGate:
         [0+0j, 1+0j, 0+0j, 0+0j],
         [0+0j, 0+0j, 0+0j, 1+0j]
     ]
-    return QuantumGate(matrix, 2, "SWAP")
+    return QuantumGate(matrix, 2, "SWAP", check_unitary=False, dtype=dtype)
+
+
+@functools.lru_cache(maxsize=None)
+def _hadamard_gate(dtype: np.dtype) -> QuantumGate:
+    """
+    获取QFT电路中反复使用的Hadamard门，矩阵与状态向量同精度，按数据类型缓存
+    """
+    return create_hadamard_gate(dtype)
+
+@functools.lru_cache(maxsize=None)
+def _fused_controlled_phases(num_bits: int, dtype: np.dtype) -> np.ndarray:
+    """
+    计算一个量子比特之后num_bits个受控相位门合并后的相位因子，结果按num_bits和数据类型缓存
+    
+    目标量子比特j之后第d个量子比特（即第j+d个）与它之间的受控相位门角度为 π/2^d。
+    把这num_bits个量子比特的取值记作整数t（第j+1个为最高位），各门都是对角门且互相对易，
+    合并后的总相位为 ∑_d bit_d · π/2^d = π·t/2^num_bits。
+    
+    参数:
+        num_bits: 目标量子比特之后的量子比特数
+        dtype: 相位因子的数据类型，与状态向量一致，避免原地乘法时的精度提升和转换
+    
+    返回:
+        np.ndarray: 长度为2^num_bits的只读数组，第t项为 e^(iπt/2^num_bits)
+    """
+    # 最低位对应的角度 π/2^num_bits 只计算一次，相位为该角度的t倍
+    unit_angle = math.pi / (1 << num_bits)
+    phases = np.exp(1j * unit_angle * np.arange(1 << num_bits)).astype(dtype)
+    phases.flags.writeable = False
+    return phases
 
 
 def apply_qft_circuit(register: QuantumRegister, num_qubits: int) -> QuantumRegister:
@@ -59,6 +95,9 @@ def apply_qft_circuit(register: QuantumRegister, num_qubits: int) -> QuantumRegi
     
     QFT|j⟩ = (1/√2^n) ∑_{k=0}^{2^n-1} e^(2πijk/2^n) |k⟩
     
+    各门直接在状态向量的副本上原地应用，不为每个门构造新的寄存器；
+    每个量子比特之后的受控相位门合并为一次对角相位乘法。
+    
     参数:
         register: 输入量子寄存器
         num_qubits: 要应用QFT的量子比特数
@@ -66,29 +105,46 @@ def apply_qft_circuit(register: QuantumRegister, num_qubits: int) -> QuantumRegi
     返回:
         QuantumRegister: 应用QFT电路后的量子寄存器
     """
-    from shor_definitions import create_hadamard_gate
+    state = register.state.copy()
     
-    result_register = register
+    # 门矩阵和相位因子与状态向量同精度
+    hadamard_gate = _hadamard_gate(state.dtype)
     
     # 对每个量子比特应用Hadamard门和受控相位门
     for j in range(num_qubits):
         # 应用Hadamard门到第j个量子比特
-        hadamard_gate = create_hadamard_gate()
-        result_register = hadamard_gate.apply_to_register(result_register, [j])
+        hadamard_gate.apply_inplace(state, [j])
         
-        # 应用受控相位门
-        for k in range(j + 1, num_qubits):
-            angle = math.pi / (2 ** (k - j))
-            cp_gate = create_controlled_phase_gate(angle)
-            result_register = cp_gate.apply_to_register(result_register, [k, j])
-    
-    return result_register
+        # 应用受控相位门：第j个量子比特与其后各量子比特之间的受控相位门合并为一次对角相位乘法，
+        # 只作用于第j个量子比特为1的那一半分量
+        num_following = num_qubits - j - 1
+        if num_following > 0:
+            view = state.reshape(1 << j, 2, 1 << num_following, -1)
+            view[:, 1] *= _fused_controlled_phases(num_following, state.dtype)[:, None]
+    
+    return QuantumRegister.from_array(state)
+
+
+@functools.lru_cache(maxsize=None)
+def _bit_reversal_permutation(num_bits: int) -> np.ndarray:
+    """
+    计算num_bits位整数的比特反转置换表，结果按num_bits缓存，返回只读数组
+    """
+    indices = np.arange(1 << num_bits, dtype=np.int64)
+    reversed_indices = np.zeros_like(indices)
+    for bit in range(num_bits):
+        reversed_indices |= ((indices >> bit) & 1) << (num_bits - 1 - bit)
+    reversed_indices.flags.writeable = False
+    return reversed_indices
 
 
 def reverse_qubit_order(register: QuantumRegister, num_qubits: int) -> QuantumRegister:
     """
     反转量子寄存器中前num_qubits个量子比特的顺序
     
+    等价于依次交换第j个和第num_qubits-j-1个量子比特。前num_qubits个量子比特是
+    状态索引的高位，因此直接按比特反转置换表重排 2^num_qubits × 2^(剩余比特) 矩阵的行。
+    
     参数:
         register: 输入量子寄存器
         num_qubits: 要反转顺序的量子比特数
@@ -96,23 +152,23 @@ def reverse_qubit_order(register: QuantumRegister, num_qubits: int) -> QuantumRe
     返回:
         QuantumRegister: 反转顺序后的量子寄存器
     """
-    result_register = register
-    
-    # 交换量子比特顺序（反转量子比特）
-    for j in range(num_qubits // 2):
-        swap_gate = create_swap_gate()
-        result_register = swap_gate.apply_to_register(result_register, [j, num_qubits - j - 1])
-    
-    return result_register
+    rows = register.state.reshape(1 << num_qubits, -1)
+    reversed_state = rows[_bit_reversal_permutation(num_qubits)].reshape(-1)
+    return QuantumRegister.from_array(reversed_state)
 
 
-def quantum_fourier_transform(register: QuantumRegister, num_qubits: int) -> QuantumRegister:
+def quantum_fourier_transform(register: QuantumRegister, num_qubits: int, use_circuit: bool = False) -> QuantumRegister:
     """
     对量子寄存器的前num_qubits个量子比特应用量子傅里叶变换
     
+    默认直接对前num_qubits个量子比特对应的轴做归一化的逆DFT（np.fft.ifft），
+    结果与应用QFT电路并反转量子比特顺序相同。
+    
     参数:
         register: 输入量子寄存器
         num_qubits: 要应用QFT的量子比特数
+        use_circuit: 为True时按QFT电路计算：对每个量子比特原地应用Hadamard门，
+            其后的受控相位门合并为一次对角相位乘法，最后按比特反转置换表重排量子比特顺序
         
     返回:
         QuantumRegister: 应用QFT后的量子寄存器
@@ -124,15 +180,49 @@ def quantum_fourier_transform(register: QuantumRegister, num_qubits: int) -> Qua
     if num_qubits > register.num_qubits:
         raise ValueError(f"num_qubits({num_qubits})大于寄存器的量子比特数({register.num_qubits})")
     
-    # 2. 应用QFT电路
-    result_register = apply_qft_circuit(register, num_qubits)
+    if use_circuit:
+        # 2. 应用QFT电路
+        result_register = apply_qft_circuit(register, num_qubits)
+        
+        # 3. 反转量子比特顺序
+        result_register = reverse_qubit_order(result_register, num_qubits)
+        
+        return result_register
+    
+    # 2. 前num_qubits个量子比特是状态索引的高位，对应 2^num_qubits × 2^(剩余比特) 矩阵的行
+    amplitudes = register.state.reshape(1 << num_qubits, -1)
+    transformed = np.fft.ifft(amplitudes, axis=0, norm='ortho')
+    
+    # QFT是酉变换，结果直接作为状态向量，不再经过set_state的复制和归一化
+    result_register = QuantumRegister.from_array(transformed.reshape(-1).astype(register.state.dtype, copy=False))
     
-    # 3. 反转量子比特顺序
-    result_register = reverse_qubit_order(result_register, num_qubits)
+    # QFT只混合前num_qubits个量子比特：原来非零的每个低位取值，变换后对所有高位取值都可能非零
+    if register.support is not None:
+        low_bits = register.num_qubits - num_qubits
+        columns = np.unique(register.support & ((1 << low_bits) - 1))
+        rows = np.arange(1 << num_qubits, dtype=np.int64) << low_bits
+        result_register.support = (rows[:, None] | columns[None, :]).reshape(-1)
     
     return result_register
 
 
+def quantum_fourier_transform_1d(amplitudes: np.ndarray) -> np.ndarray:
+    """
+    对单个寄存器的振幅向量应用量子傅里叶变换
+    
+    QFT|j⟩ = (1/√M) ∑_{k=0}^{M-1} e^(2πijk/M) |k⟩，与 quantum_fourier_transform
+    （QFT电路加量子比特反转）的结果一致。该约定对应于归一化的逆DFT，
+    因此直接使用 np.fft.ifft(norm='ortho')。
+    
+    参数:
+        amplitudes: 长度为M = 2^m的振幅向量
+        
+    返回:
+        np.ndarray: 应用QFT后的振幅向量
+    """
+    return np.fft.ifft(amplitudes, norm='ortho')
+
+
 def verify_qft_result(input_register: QuantumRegister, output_register: QuantumRegister,
                      num_qubits: int) -> bool:
     """
@@ -155,8 +245,8 @@ def verify_qft_result(input_register: QuantumRegister, output_register: QuantumR
         return False
     
     # 检查状态是否归一化
-    norm = sum(abs(x)**2 for x in output_register.state)
-    if abs(norm - 1.0) > 1e-10:
+    norm = np.vdot(output_register.state, output_register.state).real
+    if abs(norm - 1.0) > state_tolerance(output_register.state.dtype):
         return False
     
     return True
\ No newline at end of file
@@ -5,10 +5,10 @@ Shor算法步骤6：测量第一寄存器
 根据QFT的性质，测量结果c很可能接近kQ/r，其中k是某个整数。
 """
 
-import math
 import random
-from typing import List, Tuple
-from shor_definitions import QuantumRegister
+from typing import Optional, Tuple
+import numpy as np
+from shor_definitions import QuantumRegister, sample_index, state_tolerance
 
 
 def measure_first_register(state: QuantumRegister, m: int, n: int) -> Tuple[int, QuantumRegister]:
@@ -42,7 +42,7 @@ def measure_first_register(state: QuantumRegister, m: int, n: int) -> Tuple[int,
     probabilities = calculate_first_register_probabilities(state, m, n)
     
     # 3. 根据概率随机选择测量结果
-    measurement_result = random.choices(range(len(probabilities)), weights=probabilities)[0]
+    measurement_result = sample_index(probabilities)
     
     # 4. 量子态坍缩
     collapsed_state = collapse_to_measurement_result(state, m, n, measurement_result)
@@ -50,7 +50,22 @@ def measure_first_register(state: QuantumRegister, m: int, n: int) -> Tuple[int,
     return measurement_result, collapsed_state
 
 
-def calculate_first_register_probabilities(state: QuantumRegister, m: int, n: int) -> List[float]:
+def measure_first_register_1d(amplitudes: np.ndarray) -> int:
+    """
+    测量只包含第一寄存器振幅的向量，得到一个整数c
+    
+    参数:
+        amplitudes: QFT后第一寄存器的振幅向量 ∑α_c|c⟩，长度为2^m
+        
+    返回:
+        int: 测量结果c
+    """
+    probabilities = (amplitudes.conj() * amplitudes).real
+    return sample_index(probabilities)
+
+
+def calculate_first_register_probabilities(state: QuantumRegister, m: int, n: int,
+                                           squared_magnitudes: Optional[np.ndarray] = None) -> np.ndarray:
     """
     计算第一寄存器各值的测量概率
     
@@ -61,23 +76,25 @@ def calculate_first_register_probabilities(state: QuantumRegister, m: int, n: in
         state: 量子寄存器状态
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
+        squared_magnitudes: 已计算好的各基态概率|α|²（可选），提供时直接复用
         
     返回:
-        List[float]: 第一寄存器各值的概率列表，长度为2^m
+        np.ndarray: 第一寄存器各值的概率数组，长度为2^m
     """
-    # 1. 初始化概率数组
-    probabilities = [0.0] * (2 ** m)
+    # 已知非零分量时只遍历这些分量
+    if state.support is not None:
+        amplitudes = state.state[state.support]
+        c = state.support >> n
+        return np.bincount(c, weights=(amplitudes.conj() * amplitudes).real, minlength=1 << m)
     
-    # 2. 遍历所有基态
-    for i, amplitude in enumerate(state.state):
-        if abs(amplitude) < 1e-10:
-            continue
-            
-        # 3. 提取第一寄存器值
-        c = i >> n  # 右移n位，取高m位
-        
-        # 4. 累积概率
-        probabilities[c] += abs(amplitude) ** 2
+    if squared_magnitudes is not None:
+        return squared_magnitudes.reshape(1 << m, 1 << n).sum(axis=1)
+    
+    # 将状态向量视为 2^m × 2^n 矩阵，行为第一寄存器c，列为第二寄存器y
+    amplitudes = state.state.reshape(1 << m, 1 << n)
+    
+    # 对每个c值，沿第二寄存器累加振幅的平方
+    probabilities = np.einsum('ij,ij->i', amplitudes.conj(), amplitudes).real
     
     return probabilities
 
@@ -102,35 +119,33 @@ def collapse_to_measurement_result(state: QuantumRegister, m: int, n: int, measu
     if measurement_result < 0 or measurement_result >= 2 ** m:
         raise ValueError(f"测量结果{measurement_result}超出范围[0, {2**m-1}]")
     
-    # 2. 创建新的量子态向量
-    new_state = [0j] * len(state.state)
-    
-    # 3. 保留第二寄存器的所有状态
+    # 2. 保留第二寄存器的所有状态，即基态索引 [c·2^n, (c+1)·2^n) 这一段
     base_index = measurement_result << n  # c左移n位
+    block = state.state[base_index:base_index + (1 << n)]
     
-    # 复制所有与测量结果对应的状态
-    for y in range(2 ** n):
-        index = base_index | y
-        new_state[index] = state.state[index]
+    new_state = np.zeros_like(state.state)
     
-    # 4. 重新归一化
-    norm = math.sqrt(sum(abs(x)**2 for x in new_state))
+    # 3. 重新归一化
+    norm = np.linalg.norm(block)
     if norm > 0:
-        new_state = [x / norm for x in new_state]
+        new_state[base_index:base_index + (1 << n)] = block / norm
     else:
         # 如果所有振幅都为0（理论上不应该发生），随机选择一个y值
         random_y = random.randint(0, 2 ** n - 1)
         final_index = base_index | random_y
         new_state[final_index] = complex(1, 0)
     
-    # 创建新的量子寄存器
-    collapsed_register = QuantumRegister(m + n)
-    collapsed_register.set_state(new_state)
+    # 创建新的量子寄存器（new_state已归一化）
+    collapsed_register = QuantumRegister.from_array(new_state)
+    
+    # 坍缩后只有第一寄存器为c的2^n个分量可能非零
+    collapsed_register.support = base_index + np.arange(1 << n, dtype=np.int64)
     
     return collapsed_register
 
 
-def verify_measurement_result(state: QuantumRegister, m: int, n: int, measurement_result: int) -> bool:
+def verify_measurement_result(state: QuantumRegister, m: int, n: int, measurement_result: int,
+                              squared_magnitudes: Optional[np.ndarray] = None) -> bool:
     """
     验证测量结果是否正确
     
@@ -139,21 +154,19 @@ def verify_measurement_result(state: QuantumRegister, m: int, n: int, measuremen
         m: 第一寄存器的量子比特数
         n: 第二寄存器的量子比特数
         measurement_result: 测量结果
+        squared_magnitudes: 已计算好的各基态概率|α|²（可选），提供时直接复用
         
     返回:
         bool: 如果测量结果正确返回True，否则返回False
     """
+    if squared_magnitudes is None:
+        squared_magnitudes = state.probabilities()
+    
     # 1. 检查归一化
-    norm = sum(abs(x)**2 for x in state.state)
-    if abs(norm - 1.0) > 1e-10:
+    norm = squared_magnitudes.sum()
+    if abs(norm - 1.0) > state_tolerance(state.state.dtype):
         return False
     
-    # 2. 检查量子态形式
-    base_index = measurement_result << n
-    for i, amplitude in enumerate(state.state):
-        if abs(amplitude) > 1e-10:
-            # 检查第一寄存器的值是否等于测量结果
-            if (i >> n) != measurement_result:
-                return False
-    
-    return True
\ No newline at end of file
+    # 2. 检查量子态形式：所有非零分量（|α| > 1e-10）的第一寄存器值都应等于测量结果
+    non_zero_indices = np.flatnonzero(squared_magnitudes > 1e-20)
+    return bool(np.all((non_zero_indices >> n) == measurement_result))
\ No newline at end of file
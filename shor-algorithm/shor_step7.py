@@ -5,6 +5,7 @@ Shor算法步骤7：经典后处理 - 连分数算法
 使用连分数算法从测量结果c推断周期r，并最终分解合数N。
 """
 
+import functools
 import math
 from typing import List, Tuple, Optional
 
@@ -29,21 +30,29 @@ def continued_fraction_algorithm(c: int, Q: int, N: int, a: Optional[int] = None
     if Q <= 0 or N <= 0 or c < 0 or c >= Q:
         raise ValueError("输入参数无效")
     
-    # 2. 计算c/Q的连分数展开
-    coefficients = continued_fraction_expansion(c, Q)
+    # 2. 单遍展开c/Q的连分数，同时递推收敛子 p_i/q_i 的分母（周期候选只需要分母）
+    #    q_i = a_i·q_{i-1} + q_{i-2}
+    numerator, denominator = c, Q
+    q_prev, q_curr = 1, 0  # q_{-2}, q_{-1}
     
-    # 3. 尝试不同的收敛子找到可能的r
-    for i in range(1, len(coefficients) + 1):
-        # 计算第i个收敛子
-        numerator, denominator = compute_convergent(coefficients[:i])
+    for _ in range(20):  # 与 continued_fraction_expansion 的默认最大展开深度一致
+        if denominator == 0:
+            break
+        
+        coefficient = numerator // denominator
+        numerator, denominator = denominator, numerator % denominator
+        
+        q_prev, q_curr = q_curr, coefficient * q_curr + q_prev
         
-        # 检查是否为可能的周期
-        if denominator > 0 and denominator < N:
-            # 验证周期
-            if verify_period(denominator, N, a):
-                return denominator
+        # 收敛子的分母单调不减，一旦达到N，后续收敛子都不可能是周期
+        if q_curr >= N:
+            break
+        
+        # 检查是否为可能的周期并验证
+        if q_curr > 0 and verify_period(q_curr, N, a):
+            return q_curr
     
-    # 4. 如果没有找到有效周期，返回None
+    # 3. 如果没有找到有效周期，返回None
     return None
 
 
@@ -123,10 +132,13 @@ def compute_convergent(coefficients: List[int]) -> Tuple[int, int]:
     return p_minus1, q_minus1
 
 
+@functools.lru_cache(maxsize=None)
 def verify_period(r: int, N: int, a: Optional[int] = None) -> bool:
     """
     验证r是否为函数f(x) = a^x mod N的周期
     
+    结果按(r, N, a)缓存，调用 clear_post_processing_cache 清空。
+    
     参数:
         r: 待验证的周期
         N: 模数
@@ -157,10 +169,13 @@ def verify_period(r: int, N: int, a: Optional[int] = None) -> bool:
         return False
 
 
+@functools.lru_cache(maxsize=None)
 def find_factors_from_period(N: int, a: int, r: int) -> Optional[Tuple[int, int]]:
     """
     从周期r找出N的因子
     
+    结果按(N, a, r)缓存，调用 clear_post_processing_cache 清空。
+    
     参数:
         N: 要分解的合数
         a: 基数
@@ -181,9 +196,10 @@ def find_factors_from_period(N: int, a: int, r: int) -> Optional[Tuple[int, int]
         return None
     
     try:
-        # 3. 计算候选因子
-        gcd1 = math.gcd(pow(a, r // 2) - 1, N)
-        gcd2 = math.gcd(pow(a, r // 2) + 1, N)
+        # 3. 计算候选因子，gcd(a^(r/2) ± 1, N) 只依赖于 a^(r/2) mod N
+        half_power = pow(a, r // 2, N)
+        gcd1 = math.gcd(half_power - 1, N)
+        gcd2 = math.gcd(half_power + 1, N)
         
         # 4. 检查是否为有效因子
         if 1 < gcd1 < N and 1 < gcd2 < N:
@@ -198,6 +214,17 @@ def find_factors_from_period(N: int, a: int, r: int) -> Optional[Tuple[int, int]
         return None
 
 
+def clear_post_processing_cache() -> None:
+    """
+    清空 verify_period 和 find_factors_from_period 的结果缓存
+    
+    同一N的多次尝试会反复得到相同的候选周期，缓存可以避免重复计算；
+    开始分解新的N之前应清空缓存，避免缓存无限增长。
+    """
+    verify_period.cache_clear()
+    find_factors_from_period.cache_clear()
+
+
 def classical_post_processing(c: int, Q: int, N: int, a: int) -> Optional[Tuple[int, int]]:
     """
     完整的经典后处理流程